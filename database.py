@@ -22,7 +22,15 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # Keep a few warm connections so periodic jobs skip the TCP/TLS/auth handshake
+    _client = MongoClient(
+        database_url,
+        maxPoolSize=50,
+        minPoolSize=5,
+        waitQueueTimeoutMS=2000,
+        serverSelectionTimeoutMS=3000,
+        retryWrites=True,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
@@ -43,12 +51,14 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     result = db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
-    """Get documents from collection"""
+def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, projection: dict = None, sort: list = None):
+    """Get documents from collection, optionally projected and sorted"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
     
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
+    if sort:
+        cursor = cursor.sort(sort)
     if limit:
         cursor = cursor.limit(limit)
     
@@ -1,20 +1,28 @@
 import os
 import re
-import json
+import time
 import asyncio
+import logging
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from itertools import islice
+from typing import List, Optional, Tuple
 
-import httpx
+import aiohttp
+import orjson
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
+from pymongo.errors import BulkWriteError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 
-from database import db, create_document, get_documents
+from database import db, get_documents
 from schemas import Post, BlogConfig
 
-app = FastAPI(title="AutoBlog API", version="0.2.0")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="AutoBlog API", version="0.2.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,26 +45,48 @@ MEDIUM_TOKEN = os.getenv("MEDIUM_TOKEN")
 GHOST_ADMIN_API_URL = os.getenv("GHOST_ADMIN_API_URL")
 GHOST_ADMIN_API_KEY = os.getenv("GHOST_ADMIN_API_KEY")
 
+# Max articles generated in parallel (bounded by the LLM provider's rate limit)
+GEN_CONCURRENCY = max(1, int(os.getenv("GEN_CONCURRENCY", "5")))
+
 scheduler: Optional[AsyncIOScheduler] = None
 
+# ----------- Config cache -----------
+CFG_CACHE_TTL = 30  # seconds
+_cfg_cache: Optional[Tuple[float, BlogConfig]] = None
+
+def load_cfg() -> BlogConfig:
+    """Return the current BlogConfig, served from memory for up to CFG_CACHE_TTL seconds."""
+    global _cfg_cache
+    if _cfg_cache is not None and time.monotonic() - _cfg_cache[0] < CFG_CACHE_TTL:
+        return _cfg_cache[1]
+    doc = db["blogconfig"].find_one() if db is not None else None
+    cfg = BlogConfig(**{k: v for k, v in doc.items() if k != "_id"}) if doc else BlogConfig()
+    _cfg_cache = (time.monotonic(), cfg)
+    return cfg
+
+def invalidate_cfg():
+    global _cfg_cache
+    _cfg_cache = None
+
 # ----------- Networking helper -----------
-async def fetch_json(client: httpx.AsyncClient, url: str, headers: dict = None, params: dict = None):
-    for i in range(3):
-        try:
-            r = await client.get(url, headers=headers, params=params, timeout=30)
-            r.raise_for_status()
-            return r.json()
-        except Exception:
-            if i == 2:
-                raise
-            await asyncio.sleep(2 * (i + 1))
+# Transport-level failures only; HTTP 4xx/5xx responses are not retried
+RETRYABLE = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+async def fetch_json(client: aiohttp.ClientSession, url: str, headers: dict = None, params: dict = None):
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential_jitter(initial=1, max=8),
+        retry=retry_if_exception_type(RETRYABLE),
+        reraise=True,
+    ):
+        with attempt:
+            async with client.get(url, headers=headers, params=params) as r:
+                r.raise_for_status()
+                return await r.json()
 
 # ----------- Content Generation (demo) -----------
-async def generate_article(topic: str, language: str = "en") -> dict:
-    # In production, call your LLM provider here and post-process for SEO.
-    title = f"{topic}: What You Need to Know Right Now"
-    meta = f"Deep dive into {topic} with context, key takeaways, and FAQs."
-    body = f"""
+# Static article skeleton, built once at import. Placeholders: {title}, {meta}, {topic}, {jsonld}.
+_ARTICLE_TPL = """
     <article>
       <h1>{title}</h1>
       <p><em>{meta}</em></p>
@@ -82,16 +112,27 @@ async def generate_article(topic: str, language: str = "en") -> dict:
       <p>Context on impact and timing.</p>
       <h3>Where can I learn more?</h3>
       <p>Official docs, reputable sources, and communities.</p>
-      <script type=\"application/ld+json\">{json.dumps({
-        "@context": "https://schema.org",
-        "@type": "FAQPage",
-        "mainEntity": [
-          {"@type": "Question", "name": f"What is {topic}?", "acceptedAnswer": {"@type": "Answer", "text": "Explanation."}},
-          {"@type": "Question", "name": f"Why does {topic} matter now?", "acceptedAnswer": {"@type": "Answer", "text": "Context."}}
-        ]
-      })}</script>
+      <script type=\"application/ld+json\">{jsonld}</script>
     </article>
     """
+
+# FAQ JSON-LD serialized once; the topic is spliced in as an already-escaped JSON string body.
+_JSONLD_TOPIC = "__TOPIC__"
+_JSONLD_TPL = orjson.dumps({
+    "@context": "https://schema.org",
+    "@type": "FAQPage",
+    "mainEntity": [
+        {"@type": "Question", "name": f"What is {_JSONLD_TOPIC}?", "acceptedAnswer": {"@type": "Answer", "text": "Explanation."}},
+        {"@type": "Question", "name": f"Why does {_JSONLD_TOPIC} matter now?", "acceptedAnswer": {"@type": "Answer", "text": "Context."}}
+    ]
+}).decode()
+
+async def generate_article(topic: str, language: str = "en") -> dict:
+    # In production, call your LLM provider here and post-process for SEO.
+    title = f"{topic}: What You Need to Know Right Now"
+    meta = f"Deep dive into {topic} with context, key takeaways, and FAQs."
+    jsonld = _JSONLD_TPL.replace(_JSONLD_TOPIC, orjson.dumps(topic).decode()[1:-1])
+    body = _ARTICLE_TPL.format(title=title, meta=meta, topic=topic, jsonld=jsonld)
     keywords = [topic]
     return {
         "title": title,
@@ -101,6 +142,8 @@ async def generate_article(topic: str, language: str = "en") -> dict:
     }
 
 # ----------- Trend aggregation (demo) -----------
+_WS_RE = re.compile(r"\s+")
+
 async def get_google_trends(country: str = "US") -> List[str]:
     return ["AI breakthroughs", "Tech layoffs", "Electric vehicles"]
 
@@ -111,20 +154,23 @@ async def get_news_trends(country: str = "US") -> List[str]:
     return ["Stock market today", "Climate action updates"]
 
 async def aggregate_trending_topics(countries: List[str]) -> List[str]:
-    topics: List[str] = []
+    # Sources are independent I/O calls, so fetch them all at once
+    tasks = []
     for c in countries:
-        topics += await get_google_trends(c)
-        topics += await get_news_trends(c)
-    topics += await get_reddit_trends()
-    uniq: List[str] = []
-    seen = set()
-    for t in topics:
-        s = re.sub(r"\s+", " ", t).strip()
-        k = s.lower()
-        if s and k not in seen:
-            seen.add(k)
-            uniq.append(s)
-    return uniq[:20]
+        tasks += [get_google_trends(c), get_news_trends(c)]
+    tasks.append(get_reddit_trends())
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    topics: List[str] = []
+    for res in results:
+        if isinstance(res, BaseException):
+            continue
+        topics += res
+    # Dicts keep insertion order: key on the case-folded form, keep the first spelling seen
+    uniq: dict = {}
+    for s in (_WS_RE.sub(" ", t).strip() for t in topics):
+        if s:
+            uniq.setdefault(s.lower(), s)
+    return list(uniq.values())[:20]
 
 # ----------- Models -----------
 class GenerateRequest(BaseModel):
@@ -136,53 +182,101 @@ class ScheduleRequest(BaseModel):
     paused: Optional[bool] = None
 
 # ----------- Core Ops -----------
-async def make_posts(desired: int, cfg: BlogConfig) -> List[str]:
+def posts_today(now: datetime) -> int:
+    """Today's post count from daily_counters, seeded from the post collection if the counter is missing."""
+    key = now.date().isoformat()
+    counter = db["daily_counters"].find_one({"_id": key})
+    if counter:
+        return counter["count"]
+    # First read of the day (or first day after deploy): count what already exists via the created_at index.
+    # $setOnInsert so a concurrent $inc that created the doc first isn't overwritten.
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    count = db["post"].count_documents({"created_at": {"$gte": start_of_day}})
+    db["daily_counters"].update_one({"_id": key}, {"$setOnInsert": {"count": count}}, upsert=True)
+    return count
+
+async def make_posts(desired: int, cfg: BlogConfig, now: Optional[datetime] = None) -> List[str]:
     topics = await aggregate_trending_topics(cfg.country_codes)
     to_make = min(desired, len(topics))
-    made: List[str] = []
-    async with httpx.AsyncClient() as _:
-        for topic in topics[:to_make]:
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database not configured")
+    sem = asyncio.Semaphore(GEN_CONCURRENCY)
+    now = now or datetime.now(timezone.utc)
+
+    async def _one(topic: str) -> Post:
+        async with sem:
             art = await generate_article(topic, cfg.language)
-            post = Post(
+            # Internal write of our own generated data: skip validation, keep field defaults
+            return Post.model_construct(
                 topic=topic,
                 title=art["title"],
                 meta_description=art["meta"],
                 keywords=art["keywords"],
                 language=cfg.language,
                 content_html=art["content_html"],
-                created_at=datetime.now(timezone.utc),
-                updated_at=datetime.now(timezone.utc),
+                created_at=now,
+                updated_at=now,
             )
-            pid = create_document("post", post)
-            made.append(pid)
+
+    made: List[str] = []
+    posts = await asyncio.gather(*[_one(t) for t in topics[:to_make]])
+    if posts:
+        # One round-trip for the whole batch. Unordered: the other docs are still written if one fails,
+        # but pymongo raises BulkWriteError, so recover the inserted ids from its writeErrors.
+        # insert_many sets _id on each dict in place, which is what makes that possible.
+        docs = [p.model_dump() for p in posts]
+        # Seed today's counter before inserting, so the seed count doesn't include this batch
+        posts_today(now)
+        try:
+            db["post"].insert_many(docs, ordered=False)
+            failed = set()
+        except BulkWriteError as e:
+            failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        made = [str(d["_id"]) for i, d in enumerate(docs) if i not in failed]
+        # Per-UTC-day counter so the scheduler can check its quota with a single key lookup
+        db["daily_counters"].update_one({"_id": now.date().isoformat()}, {"$inc": {"count": len(made)}}, upsert=True)
     # update last_run
-    if db:
-        db["blogconfig"].update_one({}, {"$set": {"last_run_at": datetime.now(timezone.utc)}})
+    db["blogconfig"].update_one({}, {"$set": {"last_run_at": now}})
     return made
 
 async def scheduler_tick():
-    if not db:
+    if db is None:
         return
-    cfg_doc = db["blogconfig"].find_one() or BlogConfig().model_dump()
-    cfg = BlogConfig(**{k: v for k, v in cfg_doc.items() if k != "_id"})
+    cfg = load_cfg()
     if cfg.paused:
         return
     # Spread posts across the day. Run hourly and aim for posts_per_day/24 per tick.
     target_today = cfg.posts_per_day
-    start_of_day = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    made_today = db["post"].count_documents({"created_at": {"$gte": start_of_day}})
+    now = datetime.now(timezone.utc)
+    made_today = posts_today(now)
     remaining = max(0, target_today - made_today)
     if remaining == 0:
         return
     # Simple strategy: make one post per tick until target reached
-    await make_posts(1, cfg)
+    # Reuse the tick's clock so the quota check and the counter increment land on the same day
+    await make_posts(1, cfg, now)
 
 # ----------- Startup / Shutdown -----------
 @app.on_event("startup")
 async def on_startup():
     global scheduler
+    # Shared pool for outbound calls via fetch_json. Nothing uses it yet: the trend and
+    # article functions are still demo stubs. Pass app.state.http down once they make real requests.
+    app.state.http = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=30),
+        connector=aiohttp.TCPConnector(limit=100, limit_per_host=20, ttl_dns_cache=300),
+    )
+    if db is not None:
+        try:
+            # Backs /posts ordering and the range count that seeds a missing daily counter
+            # pymongo blocks; run it in a worker thread so the event loop stays free
+            await asyncio.to_thread(db["post"].create_index, [("created_at", -1)])
+        except Exception as e:
+            # The index is an optimization; report the failure but don't block startup on it
+            logger.warning("Could not create post.created_at index: %s", e)
     scheduler = AsyncIOScheduler()
-    scheduler.add_job(lambda: asyncio.create_task(scheduler_tick()), "interval", minutes=60, id="hourly_tick", replace_existing=True)
+    # AsyncIOScheduler awaits coroutine jobs itself; a slow tick must not stack up behind the next one
+    scheduler.add_job(scheduler_tick, "interval", minutes=60, id="hourly_tick", replace_existing=True, max_instances=1, coalesce=True)
     scheduler.start()
 
 @app.on_event("shutdown")
@@ -190,6 +284,9 @@ async def on_shutdown():
     global scheduler
     if scheduler:
         scheduler.shutdown(wait=False)
+    http = getattr(app.state, "http", None)
+    if http is not None:
+        await http.close()
 
 # ----------- Routes -----------
 @app.get("/")
@@ -213,8 +310,9 @@ def test_database():
             response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                # Names only, first batch capped at 10; the cursor is closed before fetching more
+                with db.list_collections(nameOnly=True, cursor={"batchSize": 10}) as cursor:
+                    response["collections"] = [c["name"] for c in islice(cursor, 10)]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️ Connected but Error: {str(e)[:80]}"
@@ -230,34 +328,47 @@ def get_schema():
 
 @app.get("/config")
 def get_config():
-    doc = db["blogconfig"].find_one() if db else None
+    doc = db["blogconfig"].find_one() if db is not None else None
     if not doc:
         cfg = BlogConfig().model_dump()
-        if db:
+        if db is not None:
             db["blogconfig"].insert_one(cfg)
+            cfg["_id"] = str(cfg["_id"])  # insert_one set an ObjectId; jsonify
         return cfg
     doc["_id"] = str(doc["_id"])  # jsonify
     return doc
 
 @app.post("/config")
 def update_config(cfg: BlogConfig):
-    if not db:
+    if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
-    cfg.last_run_at = datetime.now(timezone.utc)
-    db["blogconfig"].update_one({}, {"$set": cfg.model_dump()}, upsert=True)
+    # Only write the fields that changed; the rest are filled in if the doc doesn't exist yet.
+    # Diff against the stored doc, not the in-process cache, which may be stale on a write path.
+    current = db["blogconfig"].find_one() or {}
+    new = cfg.model_dump(exclude={"last_run_at"})
+    delta = {k: v for k, v in new.items() if current.get(k) != v}
+    if not delta:
+        return {"ok": True, "noop": True}
+    delta["last_run_at"] = datetime.now(timezone.utc)
+    update = {"$set": delta}
+    on_insert = {k: v for k, v in new.items() if k not in delta}
+    if on_insert:
+        update["$setOnInsert"] = on_insert
+    db["blogconfig"].update_one({}, update, upsert=True)
+    invalidate_cfg()
     return {"ok": True}
 
 @app.post("/generate")
 async def generate_posts(req: GenerateRequest):
-    cfg_doc = get_config()
-    cfg = BlogConfig(**{k: v for k, v in cfg_doc.items() if k != "_id"})
+    cfg = load_cfg()
     desired = req.count or cfg.posts_per_day
     made = await make_posts(desired, cfg)
     return {"created": made}
 
 @app.get("/posts")
 def list_posts(limit: int = 50):
-    docs = get_documents("post", {}, limit)
+    # List view: skip the (large) article body and return newest first via the created_at index
+    docs = get_documents("post", {}, limit, projection={"content_html": 0}, sort=[("created_at", -1)])
     for d in docs:
         d["_id"] = str(d["_id"])  # jsonify
         if isinstance(d.get("created_at"), datetime):
@@ -271,8 +382,10 @@ def schedule(req: ScheduleRequest):
         current["posts_per_day"] = req.posts_per_day
     if req.paused is not None:
         current["paused"] = req.paused
-    if db:
-        db["blogconfig"].update_one({}, {"$set": current}, upsert=True)
+    if db is not None:
+        # _id is immutable (and was stringified by get_config), so leave it out of the update
+        db["blogconfig"].update_one({}, {"$set": {k: v for k, v in current.items() if k != "_id"}}, upsert=True)
+    invalidate_cfg()
     return {"ok": True, "config": current}
 
 if __name__ == "__main__":